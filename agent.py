@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional, AsyncGenerator, Any, AsyncIterator
+from typing import Dict, List, Optional, AsyncGenerator, Any, AsyncIterator, TYPE_CHECKING
 import asyncio
 import traceback
 from context import UserSessionContext
@@ -16,7 +16,7 @@ from utils.agent_utils import (
     validate_user_input,
     sanitize_response
 )
-from utils.openai_client import client
+from utils.openai_client import client, get_async_client
 from tools.goal_analyzer import analyze_goal
 from tools.meal_planner import meal_planner
 from tools.workout_recommender import workout_recommender
@@ -27,6 +27,9 @@ from agents.injury_support_agent import InjurySupportAgent
 from agents.escalation_agent import EscalationAgent
 from guardrails import validate_goal_string, GoalOutput, MealPlanOutput, WorkoutPlanOutput
 
+if TYPE_CHECKING:
+    from utils.streaming import ImprovedAsyncResponseIterator
+
 class AsyncResponseIterator:
     """Async iterator for streaming responses from OpenRouter API."""
     
@@ -103,82 +106,6 @@ class AsyncResponseIterator:
             print(f"Stream iteration error: {str(e)}")
             raise StopAsyncIteration
 
-class ImprovedAsyncResponseIterator:
-    """Async iterator for streaming responses from OpenRouter API with improved formatting."""
-    
-    def __init__(self, client, messages, model, config):
-        """Initialize the async iterator."""
-        self.client = client
-        self.messages = messages
-        self.model = model
-        self.config = config
-        self.current_tool = None
-        self._queue = asyncio.Queue()
-        self._done = False
-        self._started = False
-        
-    async def _process_chunks(self):
-        """Process the completion chunks."""
-        try:
-            # Create completion with streaming
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                temperature=self.config.get("temperature", 0.7),
-                max_tokens=self.config.get("max_tokens", 500),
-                stream=True
-            )
-            
-            # Process each chunk without awaiting the stream directly
-            for chunk in response:
-                if not chunk or not chunk.choices:
-                    continue
-                    
-                delta = chunk.choices[0].delta
-                
-                # Handle function calls
-                if hasattr(delta, 'function_call') and delta.function_call:
-                    if not self.current_tool:
-                        self.current_tool = delta.function_call.name
-                        await self._queue.put({"tool_call": self.current_tool})
-                
-                # Handle content
-                if hasattr(delta, 'content') and delta.content:
-                    await self._queue.put(delta.content)
-            
-            # Mark as done when all chunks are processed
-            self._done = True
-            
-        except Exception as e:
-            print(f"Stream processing error: {str(e)}")
-            await self._queue.put(f"Error: {str(e)}")
-            self._done = True
-    
-    def __aiter__(self):
-        """Return self as async iterator."""
-        return self
-    
-    async def __anext__(self):
-        """Get next chunk from the stream."""
-        try:
-            # Start processing if not started
-            if not self._started:
-                self._started = True
-                asyncio.create_task(self._process_chunks())
-            
-            # Get next chunk with timeout
-            try:
-                chunk = await asyncio.wait_for(self._queue.get(), timeout=0.1)
-                return chunk
-            except asyncio.TimeoutError:
-                if self._done and self._queue.empty():
-                    raise StopAsyncIteration
-                return ""  # Return empty chunk and continue
-                
-        except Exception as e:
-            print(f"Stream iteration error: {str(e)}")
-            raise StopAsyncIteration
-
 class HealthWellnessAgent:
     """Enhanced Health & Wellness Agent with improved error handling and tool integration."""
     
@@ -291,7 +218,7 @@ class HealthWellnessAgent:
         message: str,
         context: UserSessionContext,
         system_prompt: str = None
-    ) -> ImprovedAsyncResponseIterator:
+    ) -> "ImprovedAsyncResponseIterator":
         """
         Get streaming response from the AI model with improved formatting.
         
@@ -374,9 +301,12 @@ class HealthWellnessAgent:
             # Get model configuration
             model_config = self.config.get("model", {})
             
+            # utils.streaming imports this module, so its iterator is imported at call time
+            from utils.streaming import ImprovedAsyncResponseIterator
+            
             # Return improved async iterator
             return ImprovedAsyncResponseIterator(
-                client=client,
+                client=get_async_client(),
                 messages=messages,
                 model=self.config.get_current_model(),
                 config=model_config
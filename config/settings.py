@@ -1,8 +1,10 @@
 import os
+import asyncio
+import weakref
 from pathlib import Path
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 print("Debug: Starting settings initialization...")
 
@@ -21,6 +23,8 @@ class Settings:
     """Application settings and configuration management."""
     
     _openai_client: Optional[OpenAI] = None
+    # One async client per event loop: its connections can't be reused from another loop
+    _async_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
 
     @staticmethod
     def get_required_env(key: str) -> str:
@@ -68,6 +72,23 @@ class Settings:
             )
         return cls._openai_client
 
+    @classmethod
+    def get_async_openai_client(cls) -> AsyncOpenAI:
+        """Get configured AsyncOpenAI client instance for the running event loop."""
+        print("Debug: Getting async OpenAI client...")
+        loop = asyncio.get_running_loop()
+        if loop not in cls._async_openai_clients:
+            config = cls.get_openai_config()
+            cls._async_openai_clients[loop] = AsyncOpenAI(
+                api_key=config["api_key"],
+                base_url=config["base_url"],
+                default_headers={
+                    "HTTP-Referer": config["site_url"],
+                    "X-Title": config["app_name"]
+                }
+            )
+        return cls._async_openai_clients[loop]
+
     @classmethod
     def get_model_config(cls) -> Dict[str, Any]:
         """Get AI model configuration."""
@@ -3,10 +3,11 @@ from typing import Dict, List, Any
 from pydantic import BaseModel, ValidationError
 
 # Input guardrail: validate goal string
+# Groups: direction, amount, unit, duration, duration unit
+GOAL_PATTERN = re.compile(r'^(lose|gain)\s+(\d+(?:\.\d+)?)\s*(kg|lbs)\s+in\s+(\d+)\s+(weeks?|months?)$')
 
 def validate_goal_string(goal_string: str) -> bool:
-    pattern = r'^(lose|gain)\s+\d+(\.\d+)?\s*(kg|lbs)\s+in\s+\d+\s+(weeks?|months?)$'
-    return bool(re.match(pattern, goal_string.lower()))
+    return bool(GOAL_PATTERN.match(goal_string.lower()))
 
 # Output guardrails: Pydantic models
 class GoalOutput(BaseModel):
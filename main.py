@@ -1,7 +1,7 @@
 import asyncio
 from agent import HealthWellnessAgent
 from context import UserSessionContext
-import json
+import orjson
 
 async def main():
     agent = HealthWellnessAgent()
@@ -15,7 +15,7 @@ async def main():
         response = await agent.run(user_input, context)
         # Print as JSON if possible
         try:
-            print("Assistant:", json.dumps(response, indent=2))
+            print("Assistant:", orjson.dumps(response, option=orjson.OPT_INDENT_2).decode())
         except Exception:
             print("Assistant:", response)
 
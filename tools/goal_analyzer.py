@@ -1,25 +1,83 @@
-from typing import Dict
-from guardrails import GoalOutput
-from utils.openai_client import client
-import json
+from typing import Dict, Optional
+from guardrails import GoalOutput, GOAL_PATTERN
+from utils.openai_client import acreate
+import orjson
+
+_WEEKS_PER_UNIT = {"week": 1, "month": 4}
+# Weekly change above which a goal is flagged as aggressive
+_SAFE_WEEKLY_RATE = {"kg": 1.0, "lbs": 2.0}
+
+def _parse_goal(goal_string: str) -> Optional[Dict]:
+    """Build the goal analysis straight from a 'lose 5kg in 2 months' style goal, or None if it doesn't match."""
+    match = GOAL_PATTERN.match(goal_string.strip().lower())
+    if not match:
+        return None
+    direction, amount, unit, duration, duration_unit = match.groups()
+    target_value = float(amount)
+    duration_weeks = int(duration) * _WEEKS_PER_UNIT[duration_unit.rstrip("s")]
+    if duration_weeks == 0:
+        # No weekly rate exists for a zero-length goal; leave it to the LLM path
+        return None
+    weekly_rate = target_value / duration_weeks
+    verb = "Lose" if direction == "lose" else "Gain"
+
+    if direction == "lose":
+        recommendations = [
+            "Maintain a moderate calorie deficit of 300-500 kcal per day",
+            "Combine cardio with 2-3 strength sessions per week",
+            "Prioritize protein and whole foods to stay full"
+        ]
+    else:
+        recommendations = [
+            "Maintain a moderate calorie surplus of 250-500 kcal per day",
+            "Follow a progressive strength training program 3-4 times per week",
+            "Eat 1.6-2.2 g of protein per kg of body weight daily"
+        ]
+
+    sub_goals = [f"{verb} about {round(weekly_rate, 2):g} {unit} per week"]
+    # A halfway milestone only makes sense when the goal spans more than one week
+    if duration_weeks >= 2:
+        sub_goals.append(f"{verb} {target_value / 2:g} {unit} by week {duration_weeks // 2}")
+
+    risk_factors = []
+    if weekly_rate > _SAFE_WEEKLY_RATE[unit]:
+        risk_factors.append(
+            f"Target exceeds the recommended {_SAFE_WEEKLY_RATE[unit]:g} {unit} per week; consider a longer timeline"
+        )
+
+    return {
+        "goal_type": "weight_loss" if direction == "lose" else "muscle_gain",
+        "target_value": target_value,
+        "unit": unit,
+        "duration_weeks": duration_weeks,
+        "sub_goals": sub_goals,
+        "recommendations": recommendations,
+        "risk_factors": risk_factors
+    }
 
 async def analyze_goal(goal_string: str) -> Dict:
-    system_prompt = """You are a health and fitness goal specialist. Analyze the user's goal and extract structured information. The response should be a JSON object with the following structure: {\n    \"goal_type\": \"weight_loss/muscle_gain/endurance/general_health\",\n    \"target_value\": number,\n    \"unit\": \"kg/lbs/miles/etc\",\n    \"duration_weeks\": number,\n    \"sub_goals\": [\"specific milestone 1\", \"specific milestone 2\"],\n    \"recommendations\": [\"recommendation 1\", \"recommendation 2\"],\n    \"risk_factors\": [\"risk 1\", \"risk 2\"] or []\n}\nFor goals without specific numbers, use reasonable defaults based on health guidelines."""
+    # Fast path: well-formed goals are parsed locally without an LLM round-trip.
+    # _parse_goal already emits GoalOutput-shaped data, so it skips validation.
+    goal_data = _parse_goal(goal_string)
+    if goal_data is not None:
+        return goal_data
+
+    system_prompt = """You are a health and fitness goal specialist. Extract the user's goal as a JSON object with: goal_type (weight_loss|muscle_gain|endurance|general_health), target_value (number), unit (e.g. kg, lbs, miles), duration_weeks (integer), sub_goals, recommendations, risk_factors (lists of short strings; risk_factors may be empty). Use health-guideline defaults for missing numbers."""
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"Analyze this fitness goal: {goal_string}"}
     ]
-    response = client.chat.completions.create(
+    response = await acreate(
         model="gpt-3.5-turbo-1106",
         messages=messages,
         temperature=0.7,
-        max_tokens=1000,
+        max_tokens=500,
         response_format={"type": "json_object"}
     )
     try:
-        goal_data = json.loads(response.choices[0].message.content)
+        goal_data = orjson.loads(response.choices[0].message.content)
         # Output guardrail: validate with Pydantic
-        return GoalOutput(**goal_data).dict()
+        return GoalOutput(**goal_data).model_dump(exclude_unset=True)
     except Exception:
         return {"error": "Could not parse or validate goal analysis output."}
 
@@ -33,4 +91,4 @@ analyze_goal.schema = {
         },
         "required": ["goal_string"]
     }
-} 
\ No newline at end of file
+}
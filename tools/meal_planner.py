@@ -1,7 +1,11 @@
+import asyncio
 from typing import Dict
 from guardrails import MealPlanOutput
-from utils.openai_client import client
-import json
+from utils.openai_client import acreate
+import orjson
+
+def _validate_meal_plan(meal_data: dict) -> Dict:
+    return MealPlanOutput.model_validate(meal_data).model_dump(exclude_unset=True)
 
 async def meal_planner(goal: dict, diet_preferences: str = None) -> Dict:
     system_prompt = """You are a meal planning assistant. Generate a 7-day meal plan based on the user's goal and dietary preferences. Return a JSON object with meals, total_calories, macros, and shopping_list."""
@@ -10,7 +14,7 @@ async def meal_planner(goal: dict, diet_preferences: str = None) -> Dict:
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_content}
     ]
-    response = client.chat.completions.create(
+    response = await acreate(
         model="gpt-3.5-turbo-1106",
         messages=messages,
         temperature=0.7,
@@ -18,8 +22,9 @@ async def meal_planner(goal: dict, diet_preferences: str = None) -> Dict:
         response_format={"type": "json_object"}
     )
     try:
-        meal_data = json.loads(response.choices[0].message.content)
-        return MealPlanOutput(**meal_data).dict()
+        meal_data = orjson.loads(response.choices[0].message.content)
+        # 7-day plans are the largest payloads; validate off the event loop thread
+        return await asyncio.to_thread(_validate_meal_plan, meal_data)
     except Exception:
         return {"error": "Could not parse or validate meal plan output."}
 
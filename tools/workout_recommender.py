@@ -1,25 +1,72 @@
-from typing import Dict
+import asyncio
+import hashlib
+from typing import Dict, List
 from guardrails import WorkoutPlanOutput
-from utils.openai_client import client
-import json
+from utils.openai_client import cached_chat_completion, get_cached_completion
+from utils.semantic_cache import SemanticCache
+import orjson
+
+# L2 cache: reuses plans for paraphrased goals after an exact-match (L1) miss
+_workout_cache = SemanticCache()
+
+# Completion budget per plan, and the most plans one batched completion can hold
+_PLAN_MAX_TOKENS = 800
+_BATCH_MAX_TOKENS = 4000
+_MAX_BATCH_SIZE = _BATCH_MAX_TOKENS // _PLAN_MAX_TOKENS
+
+# Goal fields that must match exactly for a cached plan to be reused
+_EXACT_GOAL_FIELDS = ("goal_type", "target_value", "unit", "duration_weeks")
+
+def _canonical_goal(goal: dict) -> str:
+    """Serialize a goal deterministically; floats are rounded so near-identical goals share a cache entry."""
+    normalized = {key: round(value, 1) if isinstance(value, float) else value for key, value in (goal or {}).items()}
+    return orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS).decode()
+
+def _semantic_scope(goal: dict, experience_level: str) -> str:
+    """Exact-match part of the L2 key: experience level plus the goal's type and numbers."""
+    goal = goal or {}
+    exact = {key: goal.get(key) for key in _EXACT_GOAL_FIELDS}
+    return _canonical_goal({"experience_level": experience_level, **exact})
+
+def _semantic_text(goal: dict) -> str:
+    """Free-text part of the goal that paraphrases differ in, for embedding."""
+    sub_goals = (goal or {}).get("sub_goals") or []
+    return "\n".join(str(sub_goal) for sub_goal in sub_goals)
+
+def _parse_plan(content: str) -> Dict:
+    """Parse and validate one workout plan reply."""
+    return WorkoutPlanOutput(**orjson.loads(content)).model_dump(exclude_unset=True)
 
 async def workout_recommender(goal: dict, experience_level: str = "beginner") -> Dict:
-    system_prompt = """You are a workout planning assistant. Generate a weekly workout plan based on the user's goal and experience level. Return a JSON object with exercises, duration_minutes, difficulty, and equipment_needed."""
-    user_content = f"Goal: {goal}\nExperience level: {experience_level}"
+    system_prompt = """You are a workout planning assistant. Generate a weekly workout plan based on the user's goal and experience level. Return a JSON object with exercises (list of objects with name, sets, reps), duration_minutes (integer), difficulty (string), and equipment_needed (list of strings)."""
+    user_content = f"Goal: {_canonical_goal(goal)}\nExperience level: {experience_level}"
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_content}
     ]
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo-1106",
-        messages=messages,
-        temperature=0.7,
-        max_tokens=1200,
-        response_format={"type": "json_object"}
-    )
+    cache_key = hashlib.sha256(b"workout:" + user_content.encode()).hexdigest()
+    # Level and numbers are exact-match scope; only the goal's free text is compared by similarity
+    semantic_scope = _semantic_scope(goal, experience_level)
+    semantic_text = _semantic_text(goal)
+    use_semantic_cache = bool(semantic_text) and _workout_cache.enabled and get_cached_completion(cache_key) is None
+    if use_semantic_cache:
+        cached_plan = await asyncio.to_thread(_workout_cache.lookup, semantic_text, semantic_scope)
+        if cached_plan is not None:
+            return cached_plan
     try:
-        workout_data = json.loads(response.choices[0].message.content)
-        return WorkoutPlanOutput(**workout_data).dict()
+        # Replies that fail validation are not cached, so the next call retries
+        workout_plan = await cached_chat_completion(
+            model="gpt-3.5-turbo-1106",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=_PLAN_MAX_TOKENS,
+            cache_key=cache_key,
+            parse=_parse_plan,
+            response_format={"type": "json_object"}
+        )
+        if use_semantic_cache:
+            await asyncio.to_thread(_workout_cache.add, semantic_text, workout_plan, semantic_scope)
+        return workout_plan
     except Exception:
         return {"error": "Could not parse or validate workout plan output."}
 
@@ -34,4 +81,47 @@ workout_recommender.schema = {
         },
         "required": ["goal"]
     }
-} 
\ No newline at end of file
+} 
+
+async def workout_recommender_batch(requests: List[Dict]) -> List[Dict]:
+    """Generate workout plans for several users in one completion.
+
+    Each request is a dict with "goal" and optional "experience_level". Results
+    keep the order of requests; entries that fail validation get an error stub.
+    """
+    if not requests:
+        return []
+    if len(requests) > _MAX_BATCH_SIZE:
+        # Larger batches would squeeze each plan below its token budget; split them and run concurrently
+        sub_batches = await asyncio.gather(*(
+            workout_recommender_batch(requests[i:i + _MAX_BATCH_SIZE])
+            for i in range(0, len(requests), _MAX_BATCH_SIZE)
+        ))
+        return [result for sub_batch in sub_batches for result in sub_batch]
+    system_prompt = """You are a workout planning assistant. For each numbered entry, generate a weekly workout plan based on the goal and experience level. Return a JSON object {"plans": [...]} with exactly one plan per entry, in order. Each plan has exercises (list of objects with name, sets, reps), duration_minutes (integer), difficulty (string), and equipment_needed (list of strings)."""
+    user_content = "\n".join(
+        f"Entry {i}: Goal: {_canonical_goal(request.get('goal'))}; Experience level: {request.get('experience_level', 'beginner')}"
+        for i, request in enumerate(requests, 1)
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+    def parse_plans(content: str) -> List[Dict]:
+        plans = orjson.loads(content)["plans"]
+        if len(plans) != len(requests):
+            raise ValueError(f"Expected {len(requests)} plans, got {len(plans)}")
+        return [WorkoutPlanOutput(**plan).model_dump(exclude_unset=True) for plan in plans]
+
+    try:
+        # The reply is only cached if every plan in it validates
+        return await cached_chat_completion(
+            model="gpt-3.5-turbo-1106",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=_PLAN_MAX_TOKENS * len(requests),
+            parse=parse_plans,
+            response_format={"type": "json_object"}
+        )
+    except Exception:
+        return [{"error": "Could not parse or validate workout plan output."} for _ in requests]
@@ -1,43 +1,73 @@
 import asyncio
 import functools
-import traceback
-from typing import Dict, Any, Optional, Callable, List
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, Optional, Callable, List, Tuple, Deque, TYPE_CHECKING
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import queue
 import datetime
 import json
 import os
-from openai import OpenAI
+import re
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that enqueues records as-is instead of formatting them first."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, so the record needs no pickle-safe copy;
+        # message merging and traceback rendering then happen on the listener thread
+        return record
+
+# Configure logging: callers only enqueue records, a listener thread does the formatting and I/O
+_root_logger = logging.getLogger()
+if not _root_logger.handlers:
+    _log_queue = queue.SimpleQueue()
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    _log_listener = QueueListener(_log_queue, _log_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    _root_logger.addHandler(_DeferredQueueHandler(_log_queue))
+    _root_logger.setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 def async_error_handler(fallback_response: str = "I apologize, but I'm experiencing technical difficulties. Please try again."):
     """Decorator for handling async function errors gracefully."""
     def decorator(func: Callable):
+        # Agent handler methods get a structured response
+        structured = func.__name__.startswith('handle_')
+        
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             try:
                 return await func(*args, **kwargs)
             except Exception as e:
-                logger.error(f"Error in {func.__name__}: {str(e)}")
-                logger.error(f"Traceback: {traceback.format_exc()}")
+                # The traceback is only formatted if a handler accepts the record
+                logger.exception("Error in %s: %s", func.__name__, e)
                 
-                # Return a structured response for agent methods
-                if func.__name__.startswith('handle_'):
+                if structured:
                     return {"message": fallback_response, "error": True}
-                else:
-                    return fallback_response
+                return fallback_response
         return wrapper
     return decorator
 
-def safe_tool_call(tool_method: Callable, *args, **kwargs) -> Optional[Any]:
-    """Safely call a tool method and return None if it fails."""
+async def safe_tool_call_async(tool_method: Callable, *args, **kwargs) -> Optional[Any]:
+    """Safely call a tool method and return None if it fails.
+    
+    Coroutine functions are awaited on the running loop; blocking callables
+    run in the default executor so they don't stall it.
+    """
     try:
         if asyncio.iscoroutinefunction(tool_method):
-            return asyncio.run(tool_method(*args, **kwargs))
-        else:
-            return tool_method(*args, **kwargs)
+            return await tool_method(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(tool_method, *args, **kwargs))
     except Exception as e:
         logger.error(f"Tool call failed: {str(e)}")
         return None
@@ -53,7 +83,7 @@ class ToolManager:
         """Register a tool with fallback handling."""
         try:
             self.tools[name] = tool_class(*args, **kwargs)
-            logger.info(f"Tool '{name}' registered successfully")
+            logger.info("Tool '%s' registered successfully", name)
         except Exception as e:
             logger.error(f"Failed to register tool '{name}': {str(e)}")
             self.tools[name] = None
@@ -82,6 +112,14 @@ class ToolManager:
         except Exception as e:
             logger.error(f"Error calling {name}.{method}: {str(e)}")
             return None
+    
+    async def call_tools_parallel(self, specs: List[Tuple[str, str, tuple, dict]]) -> List[Optional[Any]]:
+        """Call independent tool methods concurrently; results keep the order of specs."""
+        results = await asyncio.gather(
+            *(self.call_tool(name, method, *args, **kwargs) for name, method, args, kwargs in specs),
+            return_exceptions=True
+        )
+        return [None if isinstance(result, BaseException) else result for result in results]
 
 class ResponseFormatter:
     """Formats responses for better user experience."""
@@ -92,28 +130,26 @@ class ResponseFormatter:
         if not meal_plan:
             return "I couldn't generate a meal plan right now. Please try again."
         
-        formatted = "🍽️ **Your Personalized Meal Plan**\n\n"
+        parts = ["🍽️ **Your Personalized Meal Plan**\n\n"]
         
         if "meals" in meal_plan:
             for meal_type, meal_info in meal_plan["meals"].items():
-                formatted += f"**{meal_type.title()}:**\n"
+                parts.append(f"**{meal_type.title()}:**\n")
                 if isinstance(meal_info, dict):
-                    for key, value in meal_info.items():
-                        formatted += f"• {key}: {value}\n"
+                    parts.extend(f"• {key}: {value}\n" for key, value in meal_info.items())
                 else:
-                    formatted += f"• {meal_info}\n"
-                formatted += "\n"
+                    parts.append(f"• {meal_info}\n")
+                parts.append("\n")
         
         if "nutrition" in meal_plan:
-            formatted += "📊 **Nutrition Information:**\n"
+            parts.append("📊 **Nutrition Information:**\n")
             nutrition = meal_plan["nutrition"]
             if isinstance(nutrition, dict):
-                for key, value in nutrition.items():
-                    formatted += f"• {key}: {value}\n"
+                parts.extend(f"• {key}: {value}\n" for key, value in nutrition.items())
             else:
-                formatted += f"• {nutrition}\n"
+                parts.append(f"• {nutrition}\n")
         
-        return formatted
+        return "".join(parts)
     
     @staticmethod
     def format_workout_plan(workout_plan: Dict) -> str:
@@ -121,10 +157,10 @@ class ResponseFormatter:
         if not workout_plan:
             return "I couldn't generate a workout plan right now. Please try again."
         
-        formatted = "💪 **Your Personalized Workout Plan**\n\n"
+        parts = ["💪 **Your Personalized Workout Plan**\n\n"]
         
         if "exercises" in workout_plan:
-            formatted += "**Exercises:**\n"
+            parts.append("**Exercises:**\n")
             exercises = workout_plan["exercises"]
             if isinstance(exercises, list):
                 for exercise in exercises:
@@ -132,23 +168,23 @@ class ResponseFormatter:
                         name = exercise.get("name", "Unknown Exercise")
                         sets = exercise.get("sets", "N/A")
                         reps = exercise.get("reps", "N/A")
-                        formatted += f"• **{name}**: {sets} sets × {reps} reps\n"
+                        parts.append(f"• **{name}**: {sets} sets × {reps} reps\n")
                     else:
-                        formatted += f"• {exercise}\n"
+                        parts.append(f"• {exercise}\n")
             else:
-                formatted += f"• {exercises}\n"
-            formatted += "\n"
+                parts.append(f"• {exercises}\n")
+            parts.append("\n")
         
         if "duration" in workout_plan:
-            formatted += f"⏱️ **Duration:** {workout_plan['duration']}\n"
+            parts.append(f"⏱️ **Duration:** {workout_plan['duration']}\n")
         
         if "frequency" in workout_plan:
-            formatted += f"📅 **Frequency:** {workout_plan['frequency']}\n"
+            parts.append(f"📅 **Frequency:** {workout_plan['frequency']}\n")
         
         if "notes" in workout_plan:
-            formatted += f"📝 **Notes:** {workout_plan['notes']}\n"
+            parts.append(f"📝 **Notes:** {workout_plan['notes']}\n")
         
-        return formatted
+        return "".join(parts)
     
     @staticmethod
     def format_goal_analysis(goal_data: Dict) -> str:
@@ -156,27 +192,42 @@ class ResponseFormatter:
         if not goal_data:
             return "I couldn't analyze your goal right now. Please try again."
         
-        formatted = "🎯 **Goal Analysis**\n\n"
+        parts = ["🎯 **Goal Analysis**\n\n"]
         
         if "goal" in goal_data:
-            formatted += f"**Your Goal:** {goal_data['goal']}\n\n"
+            parts.append(f"**Your Goal:** {goal_data['goal']}\n\n")
         
         if "type" in goal_data:
-            formatted += f"**Goal Type:** {goal_data['type']}\n\n"
+            parts.append(f"**Goal Type:** {goal_data['type']}\n\n")
         
         if "timeline" in goal_data:
-            formatted += f"**Timeline:** {goal_data['timeline']}\n\n"
+            parts.append(f"**Timeline:** {goal_data['timeline']}\n\n")
         
         if "steps" in goal_data:
-            formatted += "**Action Steps:**\n"
+            parts.append("**Action Steps:**\n")
             steps = goal_data["steps"]
             if isinstance(steps, list):
-                for i, step in enumerate(steps, 1):
-                    formatted += f"{i}. {step}\n"
+                parts.extend(f"{i}. {step}\n" for i, step in enumerate(steps, 1))
             else:
-                formatted += f"• {steps}\n"
+                parts.append(f"• {steps}\n")
         
-        return formatted
+        return "".join(parts)
+
+# Keyword sets per message category, checked in priority order
+_CATEGORY_KEYWORDS = [
+    ("goal", frozenset(["goal", "target", "objective", "want to", "trying to", "aim to", "hope to"])),
+    ("nutrition", frozenset(["meal", "food", "diet", "nutrition", "eat", "recipe", "calories", "diabetic", "allergy"])),
+    ("fitness", frozenset(["workout", "exercise", "fitness", "training", "gym", "cardio", "strength", "muscle"])),
+    ("progress", frozenset(["progress", "track", "check-in", "update", "how am i doing", "results"])),
+    ("injury", frozenset(["injury", "pain", "hurt", "sore", "strain", "sprain", "recovery", "medical"])),
+    ("health", frozenset(["health", "wellness", "healthy", "tips", "advice", "help"])),
+]
+
+# One alternation per category; matches keywords as substrings like the original `in` checks
+_CATEGORY_PATTERNS = [
+    (category, re.compile("|".join(re.escape(keyword) for keyword in sorted(keywords))))
+    for category, keywords in _CATEGORY_KEYWORDS
+]
 
 class MessageClassifier:
     """Classifies user messages to determine appropriate handling."""
@@ -185,37 +236,9 @@ class MessageClassifier:
     def classify_message(message: str) -> str:
         """Classify a message into categories."""
         message_lower = message.lower()
-        
-        # Goal-related
-        goal_keywords = ["goal", "target", "objective", "want to", "trying to", "aim to", "hope to"]
-        if any(keyword in message_lower for keyword in goal_keywords):
-            return "goal"
-        
-        # Nutrition-related
-        nutrition_keywords = ["meal", "food", "diet", "nutrition", "eat", "recipe", "calories", "diabetic", "allergy"]
-        if any(keyword in message_lower for keyword in nutrition_keywords):
-            return "nutrition"
-        
-        # Fitness-related
-        fitness_keywords = ["workout", "exercise", "fitness", "training", "gym", "cardio", "strength", "muscle"]
-        if any(keyword in message_lower for keyword in fitness_keywords):
-            return "fitness"
-        
-        # Progress-related
-        progress_keywords = ["progress", "track", "check-in", "update", "how am i doing", "results"]
-        if any(keyword in message_lower for keyword in progress_keywords):
-            return "progress"
-        
-        # Injury/health-related
-        injury_keywords = ["injury", "pain", "hurt", "sore", "strain", "sprain", "recovery", "medical"]
-        if any(keyword in message_lower for keyword in injury_keywords):
-            return "injury"
-        
-        # General health
-        health_keywords = ["health", "wellness", "healthy", "tips", "advice", "help"]
-        if any(keyword in message_lower for keyword in health_keywords):
-            return "health"
-        
+        for category, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(message_lower):
+                return category
         return "general"
 
 class ConfigManager:
@@ -275,6 +298,20 @@ class ConfigManager:
             
         except Exception as e:
             logger.warning(f"Could not load config from {self.config_path}: {str(e)}")
+        
+        self._rebuild_flat()
+    
+    def _rebuild_flat(self):
+        """Rebuild the dotted-key lookup table used by get()."""
+        flat = {}
+        def walk(node: Dict, prefix: str):
+            for k, v in node.items():
+                key = f"{prefix}{k}"
+                flat[key] = v
+                if isinstance(v, dict):
+                    walk(v, f"{key}.")
+        walk(self.config, "")
+        self._flat = flat
     
     def _load_from_env(self):
         """Load configuration from environment variables."""
@@ -298,6 +335,9 @@ class ConfigManager:
                 if not api_key:
                     raise ValueError("OpenRouter API key not found in config or environment")
             
+            # Imported here so modules that only need the helpers don't pay for the SDK import
+            from openai import OpenAI
+            
             self.openai_client = OpenAI(
                 api_key=api_key,
                 base_url=self.config["openrouter"]["api_base"],
@@ -310,7 +350,7 @@ class ConfigManager:
             logger.error(f"Failed to initialize OpenRouter client: {str(e)}")
             self.openai_client = None
     
-    def get_ai_client(self) -> Optional[OpenAI]:
+    def get_ai_client(self) -> Optional["OpenAI"]:
         """Get the OpenRouter client."""
         return self.openai_client
     
@@ -326,19 +366,13 @@ class ConfigManager:
         """Set the current model if it's available."""
         if model_name in self.get_available_models():
             self.config["model"]["default_model"] = model_name
+            self._rebuild_flat()
             return True
         return False
     
     def get(self, key: str, default=None):
         """Get configuration value."""
-        keys = key.split('.')
-        value = self.config
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
-                return default
-        return value
+        return self._flat.get(key, default)
     
     def set(self, key: str, value: Any):
         """Set configuration value."""
@@ -349,22 +383,29 @@ class ConfigManager:
                 config_ref[k] = {}
             config_ref = config_ref[k]
         config_ref[keys[-1]] = value
+        self._rebuild_flat()
         
         # Reinitialize OpenRouter client if relevant settings changed
         if keys[0] == "openrouter" or (keys[0] == "model" and keys[-1] == "default_model"):
             self._init_openrouter()
 
+@functools.lru_cache(maxsize=1)
+def _timestamp(second: int) -> str:
+    """ISO timestamp for a given epoch second, shared by all calls within that second."""
+    return datetime.datetime.fromtimestamp(second).isoformat()
+
 class ContextManager:
     """Manages user context and session state."""
     
     def __init__(self):
         self.context = {}
-        self.session_history = []
+        # Bounded to the last 50 interactions; older entries drop off automatically
+        self.session_history: Deque[Dict[str, str]] = deque(maxlen=50)
     
     def update_context(self, key: str, value: Any):
         """Update context with new information."""
         self.context[key] = value
-        logger.info(f"Context updated: {key}")
+        logger.info("Context updated: %s", key)
     
     def get_context(self, key: str, default=None):
         """Get context value."""
@@ -375,25 +416,22 @@ class ContextManager:
         self.session_history.append({
             "message": message,
             "response": response,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": _timestamp(int(time.time()))
         })
-        
-        # Keep only last 50 interactions
-        if len(self.session_history) > 50:
-            self.session_history = self.session_history[-50:]
     
     def get_recent_context(self, limit: int = 5) -> str:
         """Get recent conversation context."""
         if not self.session_history:
             return ""
         
-        recent = self.session_history[-limit:]
-        context_str = "Recent conversation:\n"
+        recent = list(islice(reversed(self.session_history), limit))
+        recent.reverse()
+        parts = ["Recent conversation:\n"]
         for interaction in recent:
-            context_str += f"User: {interaction['message'][:100]}...\n"
-            context_str += f"Assistant: {interaction['response'][:100]}...\n\n"
+            parts.append(f"User: {interaction['message'][:100]}...\n")
+            parts.append(f"Assistant: {interaction['response'][:100]}...\n\n")
         
-        return context_str
+        return "".join(parts)
 
 # Utility functions
 async def safe_async_call(func: Callable, *args, **kwargs) -> Optional[Any]:
@@ -415,6 +453,9 @@ def validate_user_input(message: str) -> bool:
     # Add more validation as needed
     return True
 
+# Single-pass scan for URLs, emails and credential prompts in AI responses
+_SENSITIVE_RE = re.compile(r"https?://|www\.|@|password|login", re.IGNORECASE)
+
 def sanitize_response(response: str) -> str:
     """Sanitize AI response for safety."""
     # Basic sanitization - expand as needed
@@ -422,10 +463,8 @@ def sanitize_response(response: str) -> str:
         return "I apologize, but I couldn't generate a proper response. Please try again."
     
     # Remove potentially harmful content
-    sensitive_patterns = ["http://", "https://", "www.", "@", "password", "login"]
-    for pattern in sensitive_patterns:
-        if pattern in response.lower():
-            logger.warning(f"Potentially sensitive content detected: {pattern}")
+    for pattern in dict.fromkeys(match.group().lower() for match in _SENSITIVE_RE.finditer(response)):
+        logger.warning("Potentially sensitive content detected: %s", pattern)
     
     return response 
 
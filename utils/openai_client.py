@@ -1,12 +1,116 @@
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import time
+import asyncio
+import weakref
+import json
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+from openai import OpenAI, AsyncOpenAI
 
-load_dotenv()
+# Deployments that inject env vars directly can set LOAD_DOTENV=0 to skip python-dotenv
+if os.getenv("LOAD_DOTENV", "1") == "1":
+    from dotenv import load_dotenv
+    load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not set in environment variables.")
 
-client = OpenAI(api_key=OPENAI_API_KEY) 
\ No newline at end of file
+# Shared clients: every tool reuses the same keep-alive connection pool
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=httpx.Client(limits=HTTP_LIMITS))
+# Async connections are bound to the loop that opened them, and the Streamlit app
+# runs each message in a fresh loop, so every loop gets its own async client
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+def get_client() -> OpenAI:
+    """Get the shared OpenAI client."""
+    return client
+
+def get_async_client() -> AsyncOpenAI:
+    """Get the AsyncOpenAI client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        # HTTP/2 lets concurrent completions multiplex over one connection instead of opening one each
+        async_client = _async_clients[loop] = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=HTTP_TIMEOUT,
+            http_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+    return async_client
+
+# Cap on in-flight chat completions, to stay under the provider's rate limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# One semaphore per event loop: the Streamlit app runs each message in a fresh loop
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+async def acreate(**kwargs):
+    """Create a chat completion on the shared async client, bounded by LLM_MAX_CONCURRENCY."""
+    async with _llm_semaphore():
+        return await get_async_client().chat.completions.create(**kwargs)
+
+# In-process response cache: key -> (expires_at, content), oldest first
+RESPONSE_CACHE_MAXSIZE = 1000
+RESPONSE_CACHE_TTL = 86400
+_response_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+def _cache_key(model: str, messages: List[Dict], temperature: float, max_tokens: int, **kwargs) -> str:
+    payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, **kwargs}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def get_cached_completion(key: str) -> Optional[str]:
+    """Return the cached completion text for a key, or None if absent or expired."""
+    cached = _response_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        _response_cache.move_to_end(key)
+        return cached[1]
+    return None
+
+async def cached_chat_completion(
+    model: str,
+    messages: List[Dict],
+    temperature: float,
+    max_tokens: int,
+    cache_key: Optional[str] = None,
+    parse: Optional[Callable[[str], Any]] = None,
+    **kwargs
+) -> Any:
+    """Return the completion for a request, reusing a cached answer for identical requests.
+
+    Callers that already hold a canonical serialization of their input can pass
+    it as cache_key to skip re-hashing the full message list. With parse, the
+    parsed result is returned instead of the text, and a reply is only cached
+    once it parses; parse errors propagate to the caller.
+    """
+    key = cache_key or _cache_key(model, messages, temperature, max_tokens, **kwargs)
+    cached = get_cached_completion(key)
+    if cached is not None:
+        return parse(cached) if parse else cached
+
+    response = await acreate(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **kwargs
+    )
+    content = response.choices[0].message.content
+    result = parse(content) if parse else content
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, content)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > RESPONSE_CACHE_MAXSIZE:
+        _response_cache.popitem(last=False)
+    return result
@@ -0,0 +1,88 @@
+"""
+Embedding-similarity cache for LLM results whose prompts are paraphrases of each other.
+"""
+import copy
+import importlib.util
+import logging
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Returns a stored value when a new prompt's embedding is close enough to a cached one."""
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.92,
+        ttl: float = 172800,
+        maxsize: int = 1000
+    ):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # Optional dependencies, only imported on first use: sentence_transformers pulls in torch
+        self.enabled = all(importlib.util.find_spec(name) is not None for name in ("numpy", "sentence_transformers"))
+        self._model = None
+        self._lock = threading.Lock()
+        self._embeddings: List[Any] = []
+        self._entries: List[Tuple[float, str, Any]] = []  # (expires_at, scope, value), aligned with _embeddings
+
+    def _embed(self, text: str):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        # Normalized vectors make the dot product equal to cosine similarity
+        return self._model.encode(text, normalize_embeddings=True)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        keep = [i for i, (expires_at, _, _) in enumerate(self._entries) if expires_at > now]
+        if len(keep) != len(self._entries):
+            self._embeddings = [self._embeddings[i] for i in keep]
+            self._entries = [self._entries[i] for i in keep]
+
+    def lookup(self, text: str, scope: str = "") -> Optional[Any]:
+        """Return the cached value for the most similar prompt above the threshold, or None.
+
+        Only entries added under the same scope are compared, so inputs that must
+        match exactly (not just be similar) belong in the scope, not the text.
+        """
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                self._prune()
+                candidates = [i for i, (_, entry_scope, _) in enumerate(self._entries) if entry_scope == scope]
+                if not candidates:
+                    return None
+                vector = self._embed(text)
+                import numpy as np
+                scores = np.stack([self._embeddings[i] for i in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    # Callers may mutate the plan they get back; keep the cached one pristine
+                    return copy.deepcopy(self._entries[candidates[best]][2])
+                return None
+        except Exception as e:
+            logger.warning(f"Semantic cache disabled: {str(e)}")
+            self.enabled = False
+            return None
+
+    def add(self, text: str, value: Any, scope: str = "") -> None:
+        """Store a value under the embedding of its prompt, within a scope."""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                self._embeddings.append(self._embed(text))
+                self._entries.append((time.monotonic() + self.ttl, scope, copy.deepcopy(value)))
+                if len(self._entries) > self.maxsize:
+                    del self._embeddings[0]
+                    del self._entries[0]
+        except Exception as e:
+            logger.warning(f"Semantic cache disabled: {str(e)}")
+            self.enabled = False
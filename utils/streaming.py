@@ -1,21 +1,99 @@
 """
 Streaming utilities for real-time agent responses with improved formatting.
 """
-from typing import AsyncGenerator, Dict, Any, AsyncIterator
+from typing import AsyncGenerator, Dict, Any, AsyncIterator, List, Optional
 import json
 import asyncio
 import re
+from functools import lru_cache
+from openai import AsyncOpenAI
 from context import UserSessionContext
 from agent import HealthWellnessAgent
 
+# Upper bound on chunks buffered between the producer task and the consumer;
+# a slow consumer makes the producer wait instead of growing memory unbounded.
+# Must be a power of two: ring slots are picked by masking the running index.
+STREAM_QUEUE_MAXSIZE = 64
+_RING_MASK = STREAM_QUEUE_MAXSIZE - 1
+# Returned by the ring once a finished stream has been drained
+_STREAM_END = object()
+
+_STREAM_HANDLER = None
+
+# Formatting patterns, compiled once and shared by every handler/iterator
+_SENTENCE_ENDINGS_RE = re.compile(r'[.!?]+\s*')
+_SENT_RE = re.compile(r'[.!?]\s')
+
+# Punctuation that can end a sentence; a set lookup per char is cheaper than a regex scan
+_TRIGGER_CHARS = frozenset('.!?')
+# A stripped buffer that opens a bullet or header also triggers a flush
+_HEAD_FLUSH_RE = re.compile(r'\*|#{1,6}\s')
+
+# Tool results whose repr is longer than this are formatted off the event loop
+_LARGE_TOOL_RESULT_CHARS = 1024
+
+# Buffers this short are never flushed just because the stream paused
+_IDLE_FLUSH_MIN_LEN = 50
+
+# Leading slice of the buffer inspected for bullet/header prefixes
+_BUFFER_HEAD_LEN = 16
+
+# A word plus the whitespace that follows it, so batching keeps line breaks intact
+_WORD_RE = re.compile(r'\S+\s*')
+# Words emitted per yield when replaying a finished response
+STREAM_BATCH_WORDS = 8
+# Messages shorter than this are replayed as a single chunk
+STREAM_WHOLE_MESSAGE_CHARS = 256
+
+@lru_cache(maxsize=256)
+def _titleize(key: str) -> str:
+    """Turn a result key like 'target_value' into 'Target Value'; tools repeat the same keys."""
+    return key.replace('_', ' ').title()
+
+def _format_tool_result_impl(result: Any) -> str:
+    """Format tool results for better display; needs no handler state, so it is shared by every caller."""
+    try:
+        if isinstance(result, str):
+            return result
+        
+        if isinstance(result, dict):
+            # Only show non-empty values, with keys in title case
+            return '\n'.join(
+                f"• **{_titleize(key)}:** {value}" for key, value in result.items() if value
+            )
+        
+        if isinstance(result, list):
+            formatted_items = []
+            for i, item in enumerate(result, 1):
+                if isinstance(item, dict):
+                    formatted_items.append(f"{i}. {_format_tool_result_impl(item)}")
+                else:
+                    formatted_items.append(f"{i}. {item}")
+            
+            return '\n'.join(formatted_items)
+            
+        return str(result)
+        
+    except Exception as e:
+        print(f"Error formatting tool result: {e}")
+        return str(result)
+
+def _is_numbered_item(content: str) -> bool:
+    """True if content opens with digits followed by a '.', like '12. Squats'."""
+    i = 0
+    while i < len(content) and content[i].isdecimal():
+        i += 1
+    return i > 0 and content[i:i + 1] == '.'
+
+def _is_markdown_header(content: str) -> bool:
+    """True if content opens with one to six '#' followed by whitespace."""
+    hashes = len(content) - len(content.lstrip('#'))
+    return 1 <= hashes <= 6 and content[hashes:hashes + 1].isspace()
+
 class StreamHandler:
     """Handles streaming responses from the agent with improved formatting."""
 
-    def __init__(self):
-        self.sentence_endings = re.compile(r'[.!?]+\s*')
-        self.numbered_list_pattern = re.compile(r'^\d+\.\s*')
-        self.bullet_point_pattern = re.compile(r'^\*\s*')
-        self.markdown_header_pattern = re.compile(r'^#{1,6}\s+')
+    sentence_endings = _SENTENCE_ENDINGS_RE
         
     async def stream_response(
         self,
@@ -41,50 +119,82 @@ class StreamHandler:
                 yield "I apologize, but I'm having trouble generating a response. Please try again."
                 return
 
-            buffer = ""
-            last_chunk_time = asyncio.get_event_loop().time()
+            # Buffered fragments are joined once per flush rather than concatenated per chunk
+            buf_parts: List[str] = []
+            buf_len = 0
+            buf_head = ""  # first _BUFFER_HEAD_LEN chars, for bullet/header detection
+            # Only chunks with non-whitespace text are buffered, so this stands in for buffer.strip()
+            has_content = False
+            tail = ""  # last char of the previous fragment, to catch '\n\n' split across chunks
+            loop = asyncio.get_running_loop()
+            last_flush_time = loop.time()
             
             # Process chunks as they arrive
             async for chunk in response_iterator:
-                current_time = asyncio.get_event_loop().time()
-                
                 if not chunk:  # Skip empty chunks
                     continue
                     
                 if isinstance(chunk, dict):
                     # Handle tool calls and their results
                     if "tool_call" in chunk:
-                        if buffer.strip():
-                            yield self._format_and_flush_buffer(buffer)
-                            buffer = ""
+                        if has_content:
+                            yield self._format_and_flush_buffer("".join(buf_parts))
+                            buf_parts.clear()
+                            buf_len = 0
+                            buf_head = ""
+                            has_content = False
+                            tail = ""
                         yield f"\n\n🔧 **Using {chunk['tool_call']}...**\n\n"
                         
                     elif "tool_result" in chunk:
-                        if buffer.strip():
-                            yield self._format_and_flush_buffer(buffer)
-                            buffer = ""
+                        if has_content:
+                            yield self._format_and_flush_buffer("".join(buf_parts))
+                            buf_parts.clear()
+                            buf_len = 0
+                            buf_head = ""
+                            has_content = False
+                            tail = ""
                         # Format tool results nicely
                         result = chunk["tool_result"]
-                        formatted_result = self._format_tool_result(result)
+                        if isinstance(result, (list, dict)) and len(str(result)) > _LARGE_TOOL_RESULT_CHARS:
+                            # Large results are formatted in a worker thread so the loop keeps pulling chunks
+                            formatted_result = await loop.run_in_executor(None, self._format_tool_result, result)
+                        else:
+                            formatted_result = self._format_tool_result(result)
                         yield f"\n\n📊 **Results:**\n\n{formatted_result}\n\n"
                         
-                elif isinstance(chunk, str) and chunk.strip():
+                elif isinstance(chunk, str) and not chunk.isspace():  # empty chunks were skipped above
                     # Add chunk to buffer
-                    buffer += chunk
+                    buf_parts.append(chunk)
+                    buf_len += len(chunk)
+                    if len(buf_head) < _BUFFER_HEAD_LEN:
+                        buf_head = (buf_head + chunk)[:_BUFFER_HEAD_LEN]
+                    has_content = True
                     
                     # Check if we should flush the buffer
-                    should_flush = self._should_flush_buffer(buffer, current_time - last_chunk_time)
+                    should_flush = self._should_flush_buffer(
+                        tail + chunk,
+                        buf_head,
+                        buf_len,
+                        loop,
+                        last_flush_time
+                    )
+                    tail = chunk[-1]
                     
                     if should_flush:
-                        formatted_chunk = self._format_and_flush_buffer(buffer)
+                        formatted_chunk = self._format_and_flush_buffer("".join(buf_parts))
                         if formatted_chunk:
                             yield formatted_chunk
-                        buffer = ""
-                        last_chunk_time = current_time
+                        buf_parts.clear()
+                        buf_len = 0
+                        buf_head = ""
+                        has_content = False
+                        tail = ""
+                        last_flush_time = loop.time()
 
             # Flush any remaining content
-            if buffer.strip():
-                final_chunk = self._format_and_flush_buffer(buffer)
+            if has_content:
+                final_chunk = self._format_and_flush_buffer("".join(buf_parts))
                 if final_chunk:
                     yield final_chunk
 
@@ -93,55 +203,57 @@ class StreamHandler:
             print(error_msg)
             yield "\n\n❌ I apologize, but I encountered an error while processing your request. Please try again.\n\n"
 
-    def _should_flush_buffer(self, buffer: str, time_since_last: float) -> bool:
-        """Determine if buffer should be flushed based on content and timing."""
-        if not buffer.strip():
+    def _should_flush_buffer(
+        self,
+        new_fragment: str,
+        buffer_head: str,
+        buffer_len: int,
+        loop: asyncio.AbstractEventLoop,
+        last_flush_time: float
+    ) -> bool:
+        """
+        Determine if buffer should be flushed based on content and timing.
+        
+        Only the newly arrived fragment (plus one carried-over char) is scanned:
+        anything earlier in the buffer was already checked when it arrived.
+        Numbered list items need a '.', so the sentence check covers them.
+        Checks run cheapest first; the clock is read only when none of them fire.
+        """
+        if buffer_len == 0:
             return False
             
-        # Flush on complete sentences
-        if self.sentence_endings.search(buffer):
-            return True
-            
-        # Flush on numbered lists
-        if self.numbered_list_pattern.search(buffer.strip()):
-            return True
-            
-        # Flush on bullet points
-        if self.bullet_point_pattern.search(buffer.strip()):
-            return True
-            
-        # Flush on markdown headers
-        if self.markdown_header_pattern.search(buffer.strip()):
+        # Flush if buffer is getting too long
+        if buffer_len > 200:
             return True
             
-        # Flush on double line breaks (paragraph breaks)
-        if '\n\n' in buffer:
+        # Flush on complete sentences and double line breaks (paragraph breaks)
+        if not _TRIGGER_CHARS.isdisjoint(new_fragment) or '\n\n' in new_fragment:
             return True
             
-        # Flush if buffer is getting too long
-        if len(buffer) > 200:
+        # Bullet points and markdown headers are decided by how the buffer starts
+        if _HEAD_FLUSH_RE.match(buffer_head.strip()):
             return True
             
-        # Flush if there's been a pause in streaming
-        if time_since_last > 0.5:  # 500ms pause
+        # Flush if there's been a pause in streaming; during a fast stream a short
+        # buffer will hit a sentence end soon anyway, so the clock isn't consulted
+        if buffer_len > _IDLE_FLUSH_MIN_LEN and loop.time() - last_flush_time > 0.5:  # 500ms pause
             return True
             
         return False
 
     def _format_and_flush_buffer(self, buffer: str) -> str:
         """Format the buffer content and return formatted string."""
-        if not buffer.strip():
-            return ""
-            
         # Clean up the buffer
         content = buffer.strip()
+        if not content:
+            return ""
         
-        # Handle different content types
-        if self.numbered_list_pattern.match(content):
+        # Handle different content types; each is decided by a short prefix, so no regex is needed
+        if content[:1].isdecimal() and _is_numbered_item(content):
             return self._format_numbered_item(content)
-        elif self.bullet_point_pattern.match(content):
+        elif content.startswith('*'):
             return self._format_bullet_point(content)
-        elif self.markdown_header_pattern.match(content):
+        elif content.startswith('#') and _is_markdown_header(content):
             return self._format_header(content)
         else:
             return self._format_paragraph(content)
@@ -167,90 +279,102 @@ class StreamHandler:
 
     def _format_paragraph(self, content: str) -> str:
         """Format regular paragraphs."""
-        # Split on sentence boundaries and rejoin with proper spacing
-        sentences = self.sentence_endings.split(content)
+        # Single pass over the sentence boundaries; each sentence keeps the punctuation that ended it
         formatted_sentences = []
+        start = 0
+        for match in self.sentence_endings.finditer(content):
+            sentence = content[start:match.start()].strip()
+            if sentence:
+                formatted_sentences.append(sentence + match.group().strip())
+            start = match.end()
         
-        for i, sentence in enumerate(sentences):
-            if sentence.strip():
-                # Add the sentence
-                formatted_sentences.append(sentence.strip())
-                
-                # Add punctuation back if it was split
-                if i < len(sentences) - 1:
-                    # Find the punctuation that was used to split
-                    punctuation_match = self.sentence_endings.search(content[len(''.join(sentences[:i+1])):])
-                    if punctuation_match:
-                        formatted_sentences[-1] += punctuation_match.group().strip()
+        last_sentence = content[start:].strip()
+        if last_sentence:
+            formatted_sentences.append(last_sentence)
         
         if formatted_sentences:
             # Join sentences and add proper paragraph spacing
-            result = ' '.join(formatted_sentences)
-            if not result.endswith('\n'):
-                result += '\n\n'
-            return result
+            return ' '.join(formatted_sentences) + '\n\n'
         
         return content + '\n\n'
 
     def _format_tool_result(self, result: Any) -> str:
         """Format tool results for better display."""
-        try:
-            if isinstance(result, str):
-                return result
-            
-            if isinstance(result, dict):
-                formatted_parts = []
-                for key, value in result.items():
-                    if value:  # Only show non-empty values
-                        # Format key as title case
-                        formatted_key = key.replace('_', ' ').title()
-                        formatted_parts.append(f"• **{formatted_key}:** {value}")
-                
-                return '\n'.join(formatted_parts)
-            
-            if isinstance(result, list):
-                formatted_items = []
-                for i, item in enumerate(result, 1):
-                    if isinstance(item, dict):
-                        formatted_items.append(f"{i}. {self._format_tool_result(item)}")
-                    else:
-                        formatted_items.append(f"{i}. {item}")
-                
-                return '\n'.join(formatted_items)
-                
-            return str(result)
-            
-        except Exception as e:
-            print(f"Error formatting tool result: {e}")
-            return str(result)
+        return _format_tool_result_impl(result)
 
     @staticmethod
     def format_tool_result(result: Dict[str, Any]) -> str:
         """Static method for formatting tool results (backward compatibility)."""
-        handler = StreamHandler()
-        return handler._format_tool_result(result)
+        return _format_tool_result_impl(result)
+
+
+def get_stream_handler() -> StreamHandler:
+    """Return the shared StreamHandler, creating it on first use."""
+    global _STREAM_HANDLER
+    if _STREAM_HANDLER is None:
+        _STREAM_HANDLER = StreamHandler()
+    return _STREAM_HANDLER
+
+
+class JSONStreamAssembler:
+    """Accumulates streamed JSON text and parses it once it looks complete."""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._last_char = ""
+
+    def append(self, chunk: str) -> None:
+        """Add a streamed fragment without re-concatenating the whole payload."""
+        self._parts.append(chunk)
+        stripped = chunk.rstrip()
+        if stripped:
+            self._last_char = stripped[-1]
+
+    def try_parse(self) -> Optional[Any]:
+        """Return the parsed document, or None if the payload is not complete yet."""
+        # Only a closing brace/bracket can end a complete object or array
+        if self._last_char not in ("}", "]"):
+            return None
+        try:
+            return json.loads("".join(self._parts))
+        except json.JSONDecodeError:
+            return None
 
 
 class ImprovedAsyncResponseIterator:
     """Enhanced async iterator for streaming responses with better formatting."""
     
     def __init__(self, client, messages, model, config):
-        """Initialize the async iterator."""
+        """Initialize the async iterator; the completion stream is read with the async client API."""
+        if not isinstance(client, AsyncOpenAI):
+            raise TypeError(
+                f"ImprovedAsyncResponseIterator requires an AsyncOpenAI client, got {type(client).__name__}"
+            )
         self.client = client
         self.messages = messages
         self.model = model
         self.config = config
         self.current_tool = None
-        self._queue = asyncio.Queue()
+        # Single-producer/single-consumer ring buffer: _process_chunks writes, __anext__ reads
+        self._ring: List[Any] = [None] * STREAM_QUEUE_MAXSIZE
+        self._w = 0
+        self._r = 0
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
         self._done = False
         self._started = False
-        self._buffer = ""
+        self._task = None
+        # Pending text is kept as fragments and only joined when it is sent
+        self._parts: List[str] = []
+        self._len = 0
+        self._tail = ""  # last char of the previous fragment, for triggers split across fragments
+        self._triggered = False
         
     async def _process_chunks(self):
         """Process the completion chunks with improved buffering."""
         try:
-            # Create completion with streaming
-            response = self.client.chat.completions.create(
+            # Create completion with streaming; awaiting keeps network reads off the event loop thread
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=self.messages,
                 temperature=self.config.get("temperature", 0.7),
@@ -259,7 +383,7 @@ class ImprovedAsyncResponseIterator:
             )
             
             # Process each chunk
-            for chunk in response:
+            async for chunk in response:
                 if not chunk or not chunk.choices:
                     continue
                     
@@ -269,73 +393,151 @@ class ImprovedAsyncResponseIterator:
                 if hasattr(delta, 'function_call') and delta.function_call:
                     if not self.current_tool:
                         self.current_tool = delta.function_call.name
-                        await self._queue.put({"tool_call": self.current_tool})
+                        await self._put({"tool_call": self.current_tool})
                 
                 # Handle content with improved buffering
                 if hasattr(delta, 'content') and delta.content:
-                    self._buffer += delta.content
+                    self._parts.append(delta.content)
+                    self._len += len(delta.content)
                     
                     # Send chunks when we have complete thoughts
-                    if self._should_send_chunk():
-                        await self._queue.put(self._buffer)
-                        self._buffer = ""
+                    if self._should_send_chunk(delta.content):
+                        await self._put(self._take_buffer())
                     
             # Send any remaining content
-            if self._buffer:
-                await self._queue.put(self._buffer)
-                
-            # Mark as done
-            self._done = True
+            if self._parts:
+                await self._put(self._take_buffer())
             
         except Exception as e:
             print(f"Stream processing error: {str(e)}")
-            await self._queue.put(f"Error: {str(e)}")
+            await self._put(f"Error: {str(e)}")
+        
+        finally:
+            # Mark as done and wake a consumer blocked on the ring. Nothing here awaits,
+            # so a cancelled producer or a full ring abandoned by its consumer can't hang.
             self._done = True
+            self._readable.set()
     
-    def _should_send_chunk(self) -> bool:
-        """Determine if current buffer should be sent."""
-        if len(self._buffer) < 10:  # Wait for minimum content
+    async def _put(self, item: Any) -> None:
+        """Append an item to the ring, waiting while it is full."""
+        while self._w - self._r == STREAM_QUEUE_MAXSIZE:
+            self._writable.clear()
+            await self._writable.wait()
+        self._ring[self._w & _RING_MASK] = item
+        self._w += 1
+        self._readable.set()
+    
+    async def _get(self) -> Any:
+        """Take the oldest item from the ring, waiting while it is empty.
+
+        Returns _STREAM_END, on this and every later call, once the producer is
+        done and the ring has been drained.
+        """
+        while self._r == self._w:
+            if self._done:
+                return _STREAM_END
+            self._readable.clear()
+            await self._readable.wait()
+        slot = self._r & _RING_MASK
+        item = self._ring[slot]
+        self._ring[slot] = None
+        self._r += 1
+        self._writable.set()
+        return item
+    
+    def _take_buffer(self) -> str:
+        """Join and reset the pending fragments."""
+        buffer = "".join(self._parts)
+        self._parts.clear()
+        self._len = 0
+        self._tail = ""
+        self._triggered = False
+        return buffer
+    
+    def _should_send_chunk(self, fragment: str) -> bool:
+        """Determine if current buffer should be sent, scanning only the new fragment."""
+        probe = self._tail + fragment
+        self._tail = probe[-1:]
+        
+        # Sentence endings (which cover numbered list items) and line breaks; remembered until
+        # the buffer is sent. The regex needs a '.', '!' or '?', so it only runs when one is present.
+        if '\n' in fragment:
+            self._triggered = True
+        elif not _TRIGGER_CHARS.isdisjoint(probe) and _SENT_RE.search(probe):
+            self._triggered = True
+        
+        if self._len < 10:  # Wait for minimum content
             return False
-            
-        # Send on sentence endings
-        if re.search(r'[.!?]\s', self._buffer):
-            return True
-            
-        # Send on line breaks
-        if '\n' in self._buffer:
-            return True
-            
-        # Send on numbered lists
-        if re.search(r'\d+\.\s', self._buffer):
-            return True
-            
+        
         # Send when buffer gets long
-        if len(self._buffer) > 100:
-            return True
-            
-        return False
+        return self._triggered or self._len > 100
     
     def __aiter__(self):
         """Return self as async iterator."""
         return self
     
     async def __anext__(self):
-        """Get next chunk from the stream."""
+        """Get next chunk from the stream, waiting until one is ready."""
         try:
             # Start processing if not started
             if not self._started:
                 self._started = True
-                asyncio.create_task(self._process_chunks())
+                self._task = asyncio.create_task(self._process_chunks())
             
-            # Get next chunk with appropriate timeout
-            try:
-                chunk = await asyncio.wait_for(self._queue.get(), timeout=0.2)
-                return chunk
-            except asyncio.TimeoutError:
-                if self._done and self._queue.empty():
-                    raise StopAsyncIteration
-                return ""  # Return empty chunk and continue
+            chunk = await self._get()
                 
         except Exception as e:
             print(f"Stream iteration error: {str(e)}")
-            raise StopAsyncIteration 
\ No newline at end of file
+            raise StopAsyncIteration
+        
+        if chunk is _STREAM_END:
+            raise StopAsyncIteration
+        return chunk
+
+
+class StreamingManager:
+    """Replays already-generated agent responses as a stream of display chunks."""
+
+    @staticmethod
+    async def stream_response(response: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """Yield the response message a batch of words at a time."""
+        message = response.get("message", "")
+        # Splitting a short message only adds yields without showing anything sooner
+        if len(message) < STREAM_WHOLE_MESSAGE_CHARS:
+            if message and not message.isspace():
+                yield message
+            return
+        # Leading whitespace isn't part of any word; keep it with the first batch
+        lead = message[:len(message) - len(message.lstrip())]
+        words = _WORD_RE.findall(message)
+        for i in range(0, len(words), STREAM_BATCH_WORDS):
+            yield lead + "".join(words[i:i + STREAM_BATCH_WORDS])
+            lead = ""
+
+
+class Runner:
+    """Runs the agent on a message and streams the result step by step."""
+
+    @staticmethod
+    async def stream(
+        agent: HealthWellnessAgent,
+        message: str,
+        context: UserSessionContext
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """
+        Handle a message and stream the response.
+        
+        Yields:
+            Steps of the form {"type": "message" | "plan", "chunk": str}
+        """
+        if context is not None:
+            agent.context = context
+        response = await agent.handle_message(message)
+        if not isinstance(response, dict):
+            response = {"message": str(response)}
+        
+        async for chunk in StreamingManager.stream_response(response):
+            yield {"type": "message", "chunk": chunk}
+        
+        if response.get("plan"):
+            yield {"type": "plan", "chunk": f"\n\n{response['plan']}"}